@@ -8,8 +8,7 @@ setup(
         "click",
         "requests",
         "pyyaml",
-        "pyroute2",
-        "vpp-papi"
+        "pyroute2"
     ],
     entry_points={
         "console_scripts": [
@@ -1,11 +1,61 @@
+import logging
+import threading
+import time
 import requests
-from urllib.parse import urlencode
-from .route_programmer import RouteProgrammerFactory
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote
+from .route_programmer import RouteProgrammerFactory, _normalize_ipv6, _parse_net
+
+# orjson decodes API responses several times faster when it is installed
+try:
+    from orjson import loads as json_loads
+except ImportError:
+    from json import loads as json_loads
+
+log = logging.getLogger(__name__)
+
+# Maximum number of shortest path lookups in flight at once
+MAX_PATH_WORKERS = 32
+
+# Connect and read timeouts (seconds) for Jalapeno API requests
+REQUEST_TIMEOUT = (3, 10)
+
+# Shortest path responses are reused for this long (seconds) so a stale
+# topology is never used to program routes
+PATH_CACHE_TTL = 60
+PATH_CACHE_SIZE = 4096
+
+# Metric mapping from kebab-case to API endpoints
+METRIC_MAPPING = {
+    'low-latency': 'latency',
+    'least-utilized': 'utilization',
+    'data-sovereignty': 'sovereignty'
+}
 
 class JalapenoAPI:
-    def __init__(self, config):
+    def __init__(self, config, use_cache=True):
         self.config = config
-        self.debug = False  # Can be set via environment variable if needed
+        self.debug = log.isEnabledFor(logging.DEBUG)  # Follows the srctl log level (JALACTL_LOG_LEVEL)
+        self.use_cache = use_cache
+        self._path_cache = {}
+        self._path_cache_lock = threading.Lock()
+
+        # Reuse connections to the API server across all requests
+        self.session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=16,
+            pool_maxsize=MAX_PATH_WORKERS,
+            max_retries=Retry(total=3, backoff_factor=0.2, status_forcelist=[502, 503, 504],
+                              raise_on_status=False)
+        )
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def __del__(self):
+        if hasattr(self, 'session'):
+            self.session.close()
 
     def apply(self, data):
         """Send configuration to Jalapeno API"""
@@ -23,109 +73,214 @@ class JalapenoAPI:
         if not spec:
             raise ValueError("No spec found in configuration")
             
-        results = []
         platform = spec.get('platform')
         if not platform:
             raise ValueError("Platform must be specified in spec")
 
-        # Process default VRF/table routes
+        self._validate_spec(spec, platform)
+
+        # Use one programmer (and its netlink/VPP connection) for every route
+        programmer = RouteProgrammerFactory.get_programmer(platform)
+
+        # Resolve all paths concurrently, then program routes in spec order.
+        # Identical lookups are coalesced so each distinct query is sent once.
+        with ThreadPoolExecutor(max_workers=MAX_PATH_WORKERS) as executor:
+            lookups = {}
+            pending = [
+                entry
+                for af_config, af_type, table_id in self._iter_address_families(spec)
+                for entry in self._process_address_family(af_config, af_type, table_id, executor, lookups)
+            ]
+
+            return self._program_paths(pending, programmer)
+
+    def _validate_spec(self, spec, platform, deleting=False):
+        """Check every route in the spec up front, before any API or route programming I/O"""
+        errors = []
+        # Platform-specific route rules only apply once the platform is known
+        supported = RouteProgrammerFactory.supports(platform)
+        if not supported:
+            errors.append(f"Unsupported platform: {platform}")
+        is_vpp = supported and platform.lower() == 'vpp'
+        if deleting:
+            required = ('name', 'destination_prefix')
+        else:
+            required = ('name', 'graph', 'source', 'destination', 'destination_prefix')
+        
+        for af_config, af_type, table_id in self._iter_address_families(spec, errors):
+            for route in af_config.get('routes', []):
+                if not isinstance(route, dict):
+                    errors.append(f"Invalid route format: {route}")
+                    continue
+                
+                name = route.get('name', 'unknown')
+                missing = [key for key in required if not route.get(key)]
+                if missing:
+                    errors.append(f"{name}: missing {', '.join(missing)}")
+                
+                if route.get('destination_prefix'):
+                    try:
+                        _parse_net(route['destination_prefix'])
+                    except (TypeError, ValueError) as e:
+                        errors.append(f"{name}: Invalid destination prefix: {e}")
+                
+                if not deleting:
+                    if 'metric' in route and (not isinstance(route['metric'], str)
+                                              or route['metric'] not in METRIC_MAPPING):
+                        errors.append(f"{name}: Unsupported metric: {route['metric']}")
+                    excluded = route.get('excluded_countries')
+                    if excluded is not None and not (isinstance(excluded, list)
+                                                     and all(isinstance(c, str) for c in excluded)):
+                        errors.append(f"{name}: excluded_countries must be a list of country codes")
+                
+                if is_vpp:
+                    if not route.get('bsid'):
+                        errors.append(f"{name}: BSID is required for VPP routes")
+                    else:
+                        try:
+                            _normalize_ipv6(route['bsid'])
+                        except (TypeError, ValueError) as e:
+                            errors.append(f"{name}: Invalid BSID: {e}")
+                elif supported and not deleting and not route.get('outbound_interface'):
+                    errors.append(f"{name}: outbound_interface is required")
+        
+        if errors:
+            raise ValueError("Invalid PathRequest spec:\n  " + "\n  ".join(errors))
+
+    @staticmethod
+    def _iter_address_families(spec, errors=None):
+        """Yield (af_config, af_type, table_id) for the default VRF/table and each VRF/table"""
+        # Default VRF/table routes
         default_vrf = spec.get('defaultVrf', {})
-        results.extend(self._process_address_family(default_vrf.get('ipv4', {}), platform, 'ipv4', table_id=0))
-        results.extend(self._process_address_family(default_vrf.get('ipv6', {}), platform, 'ipv6', table_id=0))
+        yield default_vrf.get('ipv4', {}), 'ipv4', 0
+        yield default_vrf.get('ipv6', {}), 'ipv6', 0
 
-        # Process VRF/table-specific routes
+        # VRF/table-specific routes
         for vrf in spec.get('vrfs', []):
             table_id = vrf.get('tableId')
             if table_id is None:
-                raise ValueError(f"tableId must be specified for VRF {vrf.get('name')}")
+                # When collecting errors (spec validation), skip the VRF instead of raising
+                message = f"tableId must be specified for VRF {vrf.get('name')}"
+                if errors is None:
+                    raise ValueError(message)
+                errors.append(message)
+                continue
             
-            results.extend(self._process_address_family(vrf.get('ipv4', {}), platform, 'ipv4', table_id=table_id))
-            results.extend(self._process_address_family(vrf.get('ipv6', {}), platform, 'ipv6', table_id=table_id))
-        
-        return results
+            yield vrf.get('ipv4', {}), 'ipv4', table_id
+            yield vrf.get('ipv6', {}), 'ipv6', table_id
 
-    def _process_address_family(self, af_config, platform, af_type, table_id):
-        """Process routes for a specific address family"""
-        results = []
+    def _process_address_family(self, af_config, af_type, table_id, executor, lookups):
+        """Submit shortest path lookups for a specific address family"""
+        pending = []
         routes = af_config.get('routes', [])
         
-        # Define metric mapping from kebab-case to API endpoints
-        metric_mapping = {
-            'low-latency': 'latency',
-            'least-utilized': 'utilization',
-            'data-sovereignty': 'sovereignty'
-        }
+        # Per-graph URL prefixes, built once rather than per route
+        api_root = f"{self.config.base_url}/api/v1/graphs"
+        graph_urls = {}
         
         for route in routes:
+            # Add table_id to route configuration
+            route['table_id'] = table_id
+            
+            # Build the base URL with optional metric
+            base_url = graph_urls.get(route['graph'])
+            if base_url is None:
+                base_url = graph_urls[route['graph']] = f"{api_root}/{route['graph']}/shortest_path"
+            if 'metric' in route:
+                # Map the metric name to API endpoint
+                base_url = f"{base_url}/{METRIC_MAPPING[route['metric']]}"
+            
+            # Add query parameters
+            final_url = (f"{base_url}?source={quote(str(route['source']), safe='')}"
+                         f"&destination={quote(str(route['destination']), safe='')}"
+                         f"&direction={quote(str(route.get('direction', 'outbound')), safe='')}")  # Default to outbound
+            
+            # Add sovereignty-specific parameters
+            if route.get('metric') == 'data-sovereignty' and 'excluded_countries' in route:
+                final_url += f"&excluded_countries={quote(','.join(route['excluded_countries']), safe='')}"
+            
+            # Queue the request, sharing any identical lookup already in flight
+            lookup = lookups.get(final_url)
+            if lookup is None:
+                lookup = lookups[final_url] = executor.submit(self._get_shortest_path, final_url)
+            pending.append((route, lookup))
+        
+        return pending
+
+    def _get_shortest_path(self, url):
+        """Fetch a single shortest path from the Jalapeno API, using the cache if enabled"""
+        if self.use_cache:
+            with self._path_cache_lock:
+                cached = self._path_cache.get(url)
+            if cached and cached[0] > time.monotonic():
+                return cached[1]
+
+        if self.debug:
+            log.debug("Making request to: %s", url)
+        response = self.session.get(url, timeout=REQUEST_TIMEOUT)
+        if not response.ok:
+            raise requests.exceptions.RequestException(
+                f"API request failed with status {response.status_code}: {response.text}"
+            )
+        
+        response_data = json_loads(response.content)
+        if self.debug:
+            log.debug("API Response: %s", response_data)
+        if self.use_cache:
+            # Lookups run on worker threads, so guard eviction and insertion
+            with self._path_cache_lock:
+                # Evict the oldest entry once the cache is full
+                if url not in self._path_cache and len(self._path_cache) >= PATH_CACHE_SIZE:
+                    del self._path_cache[next(iter(self._path_cache))]
+                self._path_cache[url] = (time.monotonic() + PATH_CACHE_TTL, response_data)
+        
+        return response_data
+
+    def _program_paths(self, pending, programmer):
+        """Program all routes whose shortest path lookup succeeded as one batch"""
+        results = []
+        batch = []
+        for route, lookup in pending:
             try:
-                if not isinstance(route, dict):
-                    raise ValueError(f"Invalid route format: {route}")
-                
-                # Add table_id to route configuration
-                route['table_id'] = table_id
-                
-                # Build the base URL with optional metric
-                base_url = f"{self.config.base_url}/api/v1/graphs/{route['graph']}/shortest_path"
-                if 'metric' in route:
-                    # Map the metric name to API endpoint
-                    api_metric = metric_mapping.get(route['metric'])
-                    if not api_metric:
-                        raise ValueError(f"Unsupported metric: {route['metric']}")
-                    base_url = f"{base_url}/{api_metric}"
-                
-                # Add query parameters
-                params = {
-                    'source': route['source'],
-                    'destination': route['destination'],
-                    'direction': route.get('direction', 'outbound')  # Default to outbound
-                }
-                
-                # Add sovereignty-specific parameters
-                if route.get('metric') == 'data-sovereignty' and 'excluded_countries' in route:
-                    params['excluded_countries'] = ','.join(route['excluded_countries'])
-                
-                # Make the request
-                final_url = f"{base_url}?{urlencode(params)}"
-                response = requests.get(final_url)
-                if not response.ok:
-                    raise requests.exceptions.RequestException(
-                        f"API request failed with status {response.status_code}: {response.text}"
-                    )
-                
-                response_data = response.json()
+                response_data = lookup.result()
                 srv6_data = response_data.get('srv6_data', {})
                 srv6_usid = srv6_data.get('srv6_usid')
                 
                 if not srv6_usid:
                     raise ValueError("No SRv6 USID received from API")
                 
-                # Program the route
-                programmer = RouteProgrammerFactory.get_programmer(platform)
-                success, message = programmer.program_route(
-                    destination_prefix=route.get('destination_prefix'),
-                    srv6_usid=srv6_usid,
-                    outbound_interface=route.get('outbound_interface'),
-                    bsid=route.get('bsid'),
-                    table_id=table_id
-                )
-                
-                if not success:
-                    raise Exception(f"Route programming failed: {message}")
-                
+                batch.append((len(results), {
+                    'destination_prefix': route.get('destination_prefix'),
+                    'srv6_usid': srv6_usid,
+                    'outbound_interface': route.get('outbound_interface'),
+                    'bsid': route.get('bsid'),
+                    'table_id': route['table_id']
+                }))
                 results.append({
                     'name': route['name'],
                     'status': 'success',
-                    'data': response_data,
-                    'route_programming': message
+                    'data': response_data
                 })
                     
             except Exception as e:
                 results.append({
-                    'name': route.get('name', 'unknown'),
+                    'name': route['name'],
                     'status': 'error',
                     'error': f"Error: {str(e)}"
                 })
         
+        # Program the routes
+        outcomes = programmer.program_routes([kwargs for _, kwargs in batch])
+        for (index, _), (success, message) in zip(batch, outcomes):
+            if success:
+                results[index]['route_programming'] = message
+            else:
+                results[index] = {
+                    'name': results[index]['name'],
+                    'status': 'error',
+                    'error': f"Error: Route programming failed: {message}"
+                }
+        
         return results
 
     def delete(self, data):
@@ -144,39 +299,29 @@ class JalapenoAPI:
         if not spec:
             raise ValueError("No spec found in configuration")
             
-        results = []
         platform = spec.get('platform')
         if not platform:
             raise ValueError("Platform must be specified in spec")
 
-        # Process default VRF/table routes
-        default_vrf = spec.get('defaultVrf', {})
-        results.extend(self._delete_address_family(default_vrf.get('ipv4', {}), platform, 'ipv4', table_id=0))
-        results.extend(self._delete_address_family(default_vrf.get('ipv6', {}), platform, 'ipv6', table_id=0))
+        self._validate_spec(spec, platform, deleting=True)
 
-        # Process VRF/table-specific routes
-        for vrf in spec.get('vrfs', []):
-            table_id = vrf.get('tableId')
-            if table_id is None:
-                raise ValueError(f"tableId must be specified for VRF {vrf.get('name')}")
-            
-            results.extend(self._delete_address_family(vrf.get('ipv4', {}), platform, 'ipv4', table_id=table_id))
-            results.extend(self._delete_address_family(vrf.get('ipv6', {}), platform, 'ipv6', table_id=table_id))
-        
-        return results
+        # Use one programmer (and its netlink/VPP connection) for every route
+        programmer = RouteProgrammerFactory.get_programmer(platform)
 
-    def _delete_address_family(self, af_config, platform, af_type, table_id):
+        return [
+            result
+            for af_config, af_type, table_id in self._iter_address_families(spec)
+            for result in self._delete_address_family(af_config, af_type, table_id, programmer)
+        ]
+
+    def _delete_address_family(self, af_config, af_type, table_id, programmer):
         """Delete routes for a specific address family"""
         results = []
         routes = af_config.get('routes', [])
         
         for route in routes:
             try:
-                if not isinstance(route, dict):
-                    raise ValueError(f"Invalid route format: {route}")
-                
                 # Program route deletion
-                programmer = RouteProgrammerFactory.get_programmer(platform)
                 success, message = programmer.delete_route(
                     destination_prefix=route.get('destination_prefix'),
                     bsid=route.get('bsid'),
@@ -194,7 +339,7 @@ class JalapenoAPI:
                     
             except Exception as e:
                 results.append({
-                    'name': route.get('name', 'unknown'),
+                    'name': route['name'],
                     'status': 'error',
                     'error': f"Error: {str(e)}"
                 })
@@ -224,14 +369,14 @@ class JalapenoAPI:
                 if plus_one_limit is not None:
                     params['plus_one_limit'] = plus_one_limit
             
-            response = requests.get(f"{base_url}", params=params)
+            response = self.session.get(base_url, params=params, timeout=REQUEST_TIMEOUT)
             
             if not response.ok:
                 raise requests.exceptions.RequestException(
                     f"API request failed with status {response.status_code}: {response.text}"
                 )
             
-            return response.json()
+            return json_loads(response.content)
             
         except Exception as e:
             raise Exception(f"Failed to get paths: {str(e)}")
@@ -1,3 +1,5 @@
+import logging
+import os
 import click
 import yaml
 from .config import Config
@@ -7,12 +9,21 @@ from .api import JalapenoAPI
 @click.option('--api-server', envvar='JALAPENO_API_SERVER',
               default='http://localhost:8000',
               help='Jalapeno API server address')
+@click.option('--no-cache', is_flag=True, default=False,
+              help='Always query the API server instead of reusing cached paths')
 @click.pass_context
-def main(ctx, api_server):
+def main(ctx, api_server, no_cache):
     """Command line interface for Segment Routing Configuration"""
+    # Debug output is controlled by JALACTL_LOG_LEVEL (VPP_DEBUG still enables it)
+    default_level = 'DEBUG' if 'VPP_DEBUG' in os.environ else 'WARNING'
+    level = os.environ.get('JALACTL_LOG_LEVEL', default_level).upper()
+    # Only srctl's own loggers follow it; urllib3 and others stay at WARNING
+    logging.basicConfig(format='%(levelname)s %(name)s: %(message)s')
+    logging.getLogger('srctl').setLevel(getattr(logging, level, logging.WARNING))
+
     ctx.ensure_object(dict)
     ctx.obj['config'] = Config(api_server)
-    ctx.obj['api'] = JalapenoAPI(ctx.obj['config'])
+    ctx.obj['api'] = JalapenoAPI(ctx.obj['config'], use_cache=not no_cache)
 
 @main.command()
 @click.option('-f', '--filename', required=True, type=click.Path(exists=True),
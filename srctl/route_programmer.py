@@ -1,8 +1,45 @@
 from pyroute2 import IPRoute
-import vpp_papi
 from abc import ABC, abstractmethod
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 import os
 import ipaddress
+import logging
+import socket
+import threading
+
+log = logging.getLogger(__name__)
+
+# Maximum number of routes programmed concurrently on Linux
+MAX_PROGRAM_WORKERS = 16
+
+# Parsed destination prefix with its commonly used string forms
+_Prefix = namedtuple('_Prefix', ['net', 'net_str', 'addr_str', 'prefixlen'])
+
+@lru_cache(maxsize=8192)
+def _parse_net(prefix):
+    """Parse a destination prefix, caching the result since prefixes repeat across applies"""
+    net = ipaddress.ip_network(prefix)
+    return _Prefix(net, str(net), str(net.network_address), net.prefixlen)
+
+@lru_cache(maxsize=16384)
+def _expand_srv6_usid(usid):
+    """Expand SRv6 USID to a full, validated IPv6 address"""
+    # Remove any trailing colons and split the USID into parts
+    parts = usid.rstrip(':').split(':')
+    
+    # Add zeros to make it a complete IPv6 address (8 parts)
+    parts.extend(['0'] * (8 - len(parts)))
+    expanded = ':'.join(parts)
+    
+    ipaddress.IPv6Address(expanded)
+    return expanded
+
+@lru_cache(maxsize=4096)
+def _normalize_ipv6(addr):
+    """Validate an IPv6 address (e.g. a BSID) and return its canonical form"""
+    return str(ipaddress.IPv6Address(addr))
 
 class RouteProgrammer(ABC):
     @abstractmethod
@@ -13,25 +50,115 @@ class RouteProgrammer(ABC):
     def delete_route(self, destination_prefix, **kwargs):
         pass
 
+    def program_routes(self, routes):
+        """Program a batch of routes, returning a (success, message) tuple per route"""
+        return [self.program_route(**route) for route in routes]
+
+    def close(self):
+        """Release any connection held by the programmer"""
+        pass
+
 class LinuxRouteProgrammer(RouteProgrammer):
     def __init__(self):
         if os.geteuid() != 0:
             raise PermissionError("Root privileges required for route programming. Please run with sudo.")
         self.iproute = IPRoute()
+        self._local = threading.local()
+        self._ifindex_cache = {}
+        # Snapshot of installed routes, only taken for the duration of a batch
+        self._installed = None
 
-    def _expand_srv6_usid(self, usid):
-        """Expand SRv6 USID to full IPv6 address"""
-        # Remove any trailing colons
-        usid = usid.rstrip(':')
-        
-        # Split the USID into parts
-        parts = usid.split(':')
-        
-        # Add zeros to make it a complete IPv6 address (8 parts)
-        while len(parts) < 8:
-            parts.append('0')
-            
-        return ':'.join(parts)
+    def _netlink(self):
+        """Return the netlink socket for the calling thread"""
+        return getattr(self._local, 'iproute', self.iproute)
+
+    def _ifindex(self, name):
+        """Return the interface index for name, looking it up only once"""
+        if_index = self._ifindex_cache.get(name)
+        if if_index is None:
+            if_index = self._ifindex_cache[name] = self._netlink().link_lookup(ifname=name)[0]
+        return if_index
+
+    def _load_installed(self, routes):
+        """Index the installed routes of the batch's tables by (table, address, prefix length)"""
+        tables = set()
+        families = set()
+        for route in routes:
+            tables.add(self._route_key(route)[0])
+            try:
+                families.add(socket.AF_INET6 if _parse_net(route['destination_prefix']).net.version == 6
+                             else socket.AF_INET)
+            except Exception:
+                pass
+
+        installed = {}
+        for family in families:
+            # The kernel only filters a route dump by family, so dump each family once
+            # per batch rather than once per route
+            any_addr = '::' if family == socket.AF_INET6 else '0.0.0.0'
+            try:
+                for route in self.iproute.route('dump', family=family):
+                    table_id = route.get('RTA_TABLE') or route['table']
+                    if table_id not in tables:
+                        continue
+                    encap = route.get('RTA_ENCAP')
+                    srh = encap.get_attr('SEG6_IPTUNNEL_SRH') if encap else None
+                    segs = tuple(srh['segs']) if srh is not None and srh['mode'] == 'encap' else None
+                    # The kernel omits RTA_DST for default routes
+                    key = (table_id, route.get('RTA_DST') or any_addr, route['dst_len'])
+                    installed[key] = (route.get('RTA_OIF'), segs)
+            except Exception as e:
+                log.debug("Could not read installed routes: %s", e)
+        return installed
+
+    @staticmethod
+    def _route_key(route):
+        """Return the kernel (table, prefix) a route writes to"""
+        # Table 0 routes are installed in the main table (254)
+        table_id = route.get('table_id', 254) or 254
+        try:
+            return table_id, _parse_net(route.get('destination_prefix')).net_str
+        except Exception:
+            return table_id, str(route.get('destination_prefix'))
+
+    def program_routes(self, routes):
+        """Program a batch of routes, skipping those already installed as requested"""
+        # Interfaces may have changed since the last batch
+        self._ifindex_cache.clear()
+        self._installed = self._load_installed(routes)
+        try:
+            if len(routes) < 2:
+                return super().program_routes(routes)
+            return self._program_concurrently(routes)
+        finally:
+            self._installed = None
+
+    def _program_concurrently(self, routes):
+        """Program routes from a thread pool, using one netlink socket per worker thread"""
+        sockets = []
+
+        def open_socket():
+            self._local.iproute = IPRoute()
+            sockets.append(self._local.iproute)
+
+        # Routes for the same table/prefix run in spec order on one worker so the last one wins
+        groups = {}
+        for index, route in enumerate(routes):
+            groups.setdefault(self._route_key(route), []).append(index)
+
+        def program_group(indexes):
+            return [(index, self.program_route(**routes[index])) for index in indexes]
+
+        results = [None] * len(routes)
+        try:
+            with ThreadPoolExecutor(max_workers=MAX_PROGRAM_WORKERS, initializer=open_socket) as executor:
+                for outcomes in executor.map(program_group, groups.values()):
+                    for index, outcome in outcomes:
+                        results[index] = outcome
+            return results
+        finally:
+            for iproute in sockets:
+                iproute.close()
 
     def program_route(self, destination_prefix, srv6_usid, **kwargs):
         """Program Linux SRv6 route using pyroute2"""
@@ -41,47 +168,48 @@ class LinuxRouteProgrammer(RouteProgrammer):
             if not kwargs.get('outbound_interface'):
                 raise ValueError("outbound_interface is required")
             
+            iproute = self._netlink()
+
             # Get table ID, default to main table (254)
             table_id = kwargs.get('table_id', 254)
             
             # Validate and normalize the destination prefix
             try:
-                net = ipaddress.ip_network(destination_prefix)
-                dst = {'dst': str(net)}
+                prefix = _parse_net(destination_prefix)
             except ValueError as e:
                 raise ValueError(f"Invalid destination prefix: {e}")
 
             # Validate and normalize the SRv6 USID
             try:
-                expanded_usid = self._expand_srv6_usid(srv6_usid)
-                ipaddress.IPv6Address(expanded_usid)
+                expanded_usid = _expand_srv6_usid(srv6_usid)
             except ValueError as e:
                 raise ValueError(f"Invalid SRv6 USID: {e}")
             
             # Get interface index
-            if_index = self.iproute.link_lookup(ifname=kwargs.get('outbound_interface'))[0]
+            if_index = self._ifindex(kwargs.get('outbound_interface'))
             
             # Create encap info
             encap = {'type': 'seg6',
                     'mode': 'encap',
                     'segs': [expanded_usid]}
             
-            # Try to delete existing route first
-            try:
-                self.iproute.route('del', table=table_id, dst=str(net))
-                print(f"Deleted existing route to {str(net)} in table {table_id}")
-            except Exception as e:
-                # Ignore errors if route doesn't exist
-                pass
+            # Skip the write if the batch snapshot shows this exact route installed
+            installed = self._installed
+            key = (table_id or 254, prefix.addr_str, prefix.prefixlen)
+            desired = (if_index, (_normalize_ipv6(expanded_usid),))
+            if installed is not None and installed.get(key) == desired:
+                return True, f"Route to {destination_prefix} via {expanded_usid} already programmed in table {table_id}"
             
-            print(f"Adding route with encap: {encap} to table {table_id}")
+            log.debug("Replacing route with encap: %s in table %s", encap, table_id)
             
-            # Add new route
-            self.iproute.route('add',
-                             table=table_id,
-                             dst=str(net),
-                             oif=if_index,
-                             encap=encap)
+            # Add the route, atomically overwriting any existing one
+            iproute.route('replace',
+                          table=table_id,
+                          dst=prefix.net_str,
+                          oif=if_index,
+                          encap=encap)
+            if installed is not None:
+                installed[key] = desired
             
             return True, f"Route to {destination_prefix} via {expanded_usid} programmed successfully in table {table_id}"
         except Exception as e:
@@ -98,13 +226,13 @@ class LinuxRouteProgrammer(RouteProgrammer):
             
             # Validate and normalize the destination prefix
             try:
-                net = ipaddress.ip_network(destination_prefix)
+                prefix = _parse_net(destination_prefix)
             except ValueError as e:
                 raise ValueError(f"Invalid destination prefix: {e}")
             
             # Delete the route
             try:
-                self.iproute.route('del', table=table_id, dst=str(net))
+                self.iproute.route('del', table=table_id, dst=prefix.net_str)
                 return True, f"Route to {destination_prefix} deleted successfully from table {table_id}"
             except Exception as e:
                 if "No such process" in str(e):
@@ -114,9 +242,14 @@ class LinuxRouteProgrammer(RouteProgrammer):
         except Exception as e:
             return False, f"Failed to delete route: {str(e)}"
 
-    def __del__(self):
-        if hasattr(self, 'iproute'):
+    def close(self):
+        """Close the netlink socket"""
+        if getattr(self, 'iproute', None) is not None:
             self.iproute.close()
+            self.iproute = None
+
+    def __del__(self):
+        self.close()
 
 class VPPRouteProgrammer(RouteProgrammer):
     def __init__(self):
@@ -131,54 +264,42 @@ class VPPRouteProgrammer(RouteProgrammer):
                 raise RuntimeError("Failed to access VPP CLI")
                 
             self.version = result.stdout.strip()
-            # Only print version if verbose logging is enabled
-            if 'VPP_DEBUG' in os.environ:
-                print(f"Connected to VPP version: {self.version}")
+            log.debug("Connected to VPP version: %s", self.version)
             
         except Exception as e:
             raise RuntimeError(f"Failed to connect to VPP: {str(e)}")
 
-    def _expand_srv6_usid(self, usid):
-        """Expand SRv6 USID to full IPv6 address"""
-        # Remove any trailing colons
-        usid = usid.rstrip(':')
-        
-        # Split the USID into parts
-        parts = usid.split(':')
-        
-        # Add zeros to make it a complete IPv6 address (8 parts)
-        while len(parts) < 8:
-            parts.append('0')
-            
-        return ':'.join(parts)
+    def _route_commands(self, destination_prefix, srv6_usid, **kwargs):
+        """Validate a route and build its SR policy and steering CLI commands"""
+        bsid = kwargs.get('bsid')
+        if not bsid:
+            raise ValueError("BSID is required for VPP routes")
+
+        # Validate inputs
+        try:
+            prefix = _parse_net(destination_prefix)
+            expanded_usid = _expand_srv6_usid(srv6_usid)
+            bsid = _normalize_ipv6(bsid)
+        except ValueError as e:
+            raise ValueError(f"Invalid input parameters: {str(e)}")
+
+        return (f"sr policy add bsid {bsid} next {expanded_usid} encap",
+                f"sr steer l3 {prefix.net_str} via bsid {bsid}")
 
     def program_route(self, destination_prefix, srv6_usid, **kwargs):
         """Program VPP SRv6 route using CLI"""
         try:
-            bsid = kwargs.get('bsid')
-            if not bsid:
-                raise ValueError("BSID is required for VPP routes")
-
-            # Validate inputs
-            try:
-                net = ipaddress.ip_network(destination_prefix)
-                expanded_usid = self._expand_srv6_usid(srv6_usid)
-            except ValueError as e:
-                raise ValueError(f"Invalid input parameters: {str(e)}")
+            policy_cmd, steer_cmd = self._route_commands(destination_prefix, srv6_usid, **kwargs)
 
             # Add SR policy
-            policy_cmd = f"sr policy add bsid {bsid} next {expanded_usid} encap"
-            if 'VPP_DEBUG' in os.environ:
-                print(f"Executing: vppctl {policy_cmd}")
+            log.debug("Executing: vppctl %s", policy_cmd)
             result = self.subprocess.run(['vppctl'] + policy_cmd.split(), 
                                       capture_output=True, text=True)
             if result.returncode != 0:
                 raise RuntimeError(f"Failed to add SR policy: {result.stderr}")
 
             # Add steering policy
-            steer_cmd = f"sr steer l3 {destination_prefix} via bsid {bsid}"
-            if 'VPP_DEBUG' in os.environ:
-                print(f"Executing: vppctl {steer_cmd}")
+            log.debug("Executing: vppctl %s", steer_cmd)
             result = self.subprocess.run(['vppctl'] + steer_cmd.split(), 
                                       capture_output=True, text=True)
             if result.returncode != 0:
@@ -188,6 +309,64 @@ class VPPRouteProgrammer(RouteProgrammer):
         except Exception as e:
             return False, f"Failed to program route: {str(e)}"
 
+    def program_routes(self, routes):
+        """Program routes by piping all of their CLI commands through a single vppctl"""
+        if len(routes) < 2:
+            return super().program_routes(routes)
+
+        results = [None] * len(routes)
+        commands = []
+        markers = {}
+        for index, route in enumerate(routes):
+            try:
+                route_commands = self._route_commands(**route)
+            except Exception as e:
+                results[index] = (False, f"Failed to program route: {str(e)}")
+                continue
+
+            # VPP's CLI keeps going after a failed line, so each route's commands are
+            # followed by an echoed marker that delimits that route's output
+            marker = f"srctl-route-done-{index}"
+            markers[marker] = index
+            commands.extend(route_commands)
+            commands.append(f"echo {marker}")
+
+        if commands:
+            log.debug("Executing: vppctl with %d commands: %s", len(commands), commands)
+            result = self.subprocess.run(['vppctl'], input='\n'.join(commands) + '\n',
+                                         capture_output=True, text=True)
+            outputs = self._split_batch_output(result.stdout, commands, markers)
+            for index in markers.values():
+                if index not in outputs:
+                    error = result.stderr.strip() or "vppctl exited before the route was programmed"
+                    results[index] = (False, f"Failed to program route: {error}")
+                elif outputs[index]:
+                    results[index] = (False, f"Failed to program route: {'; '.join(outputs[index])}")
+                else:
+                    results[index] = (True, "Route programmed successfully")
+
+        return results
+
+    @staticmethod
+    def _split_batch_output(stdout, commands, markers):
+        """Map each route index to the vppctl output lines printed before its marker"""
+        # SR policy and steering commands print nothing on success
+        sent = set(commands)
+        outputs = {}
+        current = []
+        for line in stdout.splitlines():
+            line = line.strip()
+            if line.startswith('vpp#'):
+                line = line[len('vpp#'):].strip()
+            if not line or line in sent:
+                continue
+            if line in markers:
+                outputs[markers[line]] = current
+                current = []
+            else:
+                current.append(line)
+        return outputs
+
     def delete_route(self, destination_prefix, **kwargs):
         """Delete VPP SRv6 route using CLI"""
         try:
@@ -197,8 +376,7 @@ class VPPRouteProgrammer(RouteProgrammer):
 
             # Delete steering policy first
             steer_cmd = f"sr steer del l3 {destination_prefix}"
-            if 'VPP_DEBUG' in os.environ:
-                print(f"Executing: vppctl {steer_cmd}")
+            log.debug("Executing: vppctl %s", steer_cmd)
             result = self.subprocess.run(['vppctl'] + steer_cmd.split(), 
                                       capture_output=True, text=True)
             if result.returncode != 0:
@@ -206,8 +384,7 @@ class VPPRouteProgrammer(RouteProgrammer):
 
             # Then delete SR policy
             policy_cmd = f"sr policy del bsid {bsid}"
-            if 'VPP_DEBUG' in os.environ:
-                print(f"Executing: vppctl {policy_cmd}")
+            log.debug("Executing: vppctl %s", policy_cmd)
             result = self.subprocess.run(['vppctl'] + policy_cmd.split(), 
                                       capture_output=True, text=True)
             if result.returncode != 0:
@@ -221,11 +398,31 @@ class VPPRouteProgrammer(RouteProgrammer):
         pass  # No cleanup needed for CLI approach
 
 class RouteProgrammerFactory:
-    @staticmethod
-    def get_programmer(platform):
-        if platform.lower() == 'linux':
-            return LinuxRouteProgrammer()
-        elif platform.lower() == 'vpp':
-            return VPPRouteProgrammer()
-        else:
-            raise ValueError(f"Unsupported platform: {platform}") 
\ No newline at end of file
+    _programmers = {
+        'linux': LinuxRouteProgrammer,
+        'vpp': VPPRouteProgrammer
+    }
+    _cache = {}
+
+    @classmethod
+    def supports(cls, platform):
+        """Return whether a programmer exists for the platform"""
+        return isinstance(platform, str) and platform.lower() in cls._programmers
+
+    @classmethod
+    def get_programmer(cls, platform):
+        """Return the shared programmer for a platform, creating it on first use"""
+        key = platform.lower()
+        programmer = cls._cache.get(key)
+        if programmer is None:
+            if key not in cls._programmers:
+                raise ValueError(f"Unsupported platform: {platform}")
+            programmer = cls._cache[key] = cls._programmers[key]()
+        return programmer
+
+    @classmethod
+    def clear(cls):
+        """Close and drop all cached programmers"""
+        for programmer in cls._cache.values():
+            programmer.close()
+        cls._cache.clear()
@@ -0,0 +1,241 @@
+import json
+import threading
+
+import pytest
+
+from srctl import api
+from srctl.config import Config
+
+
+class FakeResponse:
+    def __init__(self, body, status_code=200):
+        self.status_code = status_code
+        self.ok = status_code < 400
+        self.content = json.dumps(body).encode()
+        self.text = self.content.decode()
+
+
+class FakeSession:
+    """Stands in for requests.Session, answering every GET with one SRv6 path"""
+
+    def __init__(self, status_code=200):
+        self.status_code = status_code
+        self.urls = []
+        self.lock = threading.Lock()
+
+    def get(self, url, **kwargs):
+        with self.lock:
+            self.urls.append(url)
+        return FakeResponse({'srv6_data': {'srv6_usid': 'fc00:0:1::'}, 'url': url}, self.status_code)
+
+    def close(self):
+        pass
+
+
+class FakeProgrammer:
+    def __init__(self):
+        self.routes = []
+        self.platforms = []
+
+    def program_routes(self, routes):
+        self.routes.extend(routes)
+        return [(True, f"programmed {route['destination_prefix']}") for route in routes]
+
+
+@pytest.fixture
+def programmer(monkeypatch):
+    programmer = FakeProgrammer()
+
+    def get_programmer(platform):
+        programmer.platforms.append(platform)
+        return programmer
+
+    monkeypatch.setattr(api.RouteProgrammerFactory, 'get_programmer', get_programmer)
+    return programmer
+
+
+@pytest.fixture
+def client():
+    client = api.JalapenoAPI(Config('http://jalapeno:8000'))
+    client.session = FakeSession()
+    return client
+
+
+def route(name, destination_prefix, **kwargs):
+    return dict({'name': name, 'graph': 'ipv4_graph', 'source': 'hosts/rome', 'destination': 'hosts/amsterdam',
+                 'destination_prefix': destination_prefix, 'outbound_interface': 'eth0'}, **kwargs)
+
+
+def path_request(routes, vrfs=()):
+    return {'kind': 'PathRequest',
+            'spec': {'platform': 'linux', 'defaultVrf': {'ipv4': {'routes': routes}}, 'vrfs': list(vrfs)}}
+
+
+def test_apply_coalesces_identical_lookups(client, programmer):
+    routes = [route('a', '10.0.0.0/24'), route('b', '10.0.1.0/24'), route('c', '10.0.2.0/24')]
+    vrf = {'name': 'blue', 'tableId': 100, 'ipv4': {'routes': [route('d', '10.0.3.0/24')]}}
+
+    results = client.apply(path_request(routes, [vrf]))
+
+    assert len(client.session.urls) == 1
+    assert [result['name'] for result in results] == ['a', 'b', 'c', 'd']
+    assert all(result['status'] == 'success' for result in results)
+    assert [result['route_programming'] for result in results] == [
+        'programmed 10.0.0.0/24', 'programmed 10.0.1.0/24', 'programmed 10.0.2.0/24', 'programmed 10.0.3.0/24']
+    assert [r['table_id'] for r in programmer.routes] == [0, 0, 0, 100]
+
+
+def test_apply_coalesced_lookup_error_is_reported_per_route(client, programmer):
+    client.session = FakeSession(status_code=500)
+    routes = [route('a', '10.0.0.0/24'), route('b', '10.0.1.0/24')]
+
+    results = client.apply(path_request(routes))
+
+    assert len(client.session.urls) == 1
+    assert [(result['name'], result['status']) for result in results] == [('a', 'error'), ('b', 'error')]
+    assert results[0] is not results[1]
+    assert programmer.routes == []
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(api.time, 'monotonic', lambda: now[0])
+    return now
+
+
+def test_shortest_path_cache_hit_until_ttl_expires(client, clock):
+    client._get_shortest_path('http://jalapeno:8000/a')
+    clock[0] += api.PATH_CACHE_TTL - 1
+    client._get_shortest_path('http://jalapeno:8000/a')
+    assert len(client.session.urls) == 1
+
+    clock[0] += 2
+    client._get_shortest_path('http://jalapeno:8000/a')
+    assert len(client.session.urls) == 2
+
+
+def test_shortest_path_cache_evicts_oldest_entry(client, clock, monkeypatch):
+    monkeypatch.setattr(api, 'PATH_CACHE_SIZE', 3)
+    for url in ('a', 'b', 'c', 'd'):
+        client._get_shortest_path(url)
+
+    assert list(client._path_cache) == ['b', 'c', 'd']
+    client._get_shortest_path('a')
+    assert client.session.urls == ['a', 'b', 'c', 'd', 'a']
+
+
+def test_shortest_path_cache_disabled(clock):
+    client = api.JalapenoAPI(Config('http://jalapeno:8000'), use_cache=False)
+    client.session = FakeSession()
+    client._get_shortest_path('a')
+    client._get_shortest_path('a')
+
+    assert client.session.urls == ['a', 'a']
+    assert client._path_cache == {}
+
+
+def test_shortest_path_cache_concurrent_inserts_at_capacity(client, monkeypatch):
+    from concurrent.futures import ThreadPoolExecutor
+    monkeypatch.setattr(api, 'PATH_CACHE_SIZE', 8)
+    urls = [f'u{i}' for i in range(5000)]
+
+    with ThreadPoolExecutor(max_workers=api.MAX_PATH_WORKERS) as executor:
+        list(executor.map(client._get_shortest_path, urls))
+
+    assert len(client._path_cache) == 8
+
+
+@pytest.mark.parametrize('args, use_cache', [([], True), (['--no-cache'], False)])
+def test_cli_no_cache_flag(monkeypatch, args, use_cache):
+    from click.testing import CliRunner
+    from srctl import cli
+    created = []
+
+    class RecordingAPI(api.JalapenoAPI):
+        def __init__(self, config, use_cache=True):
+            super().__init__(config, use_cache=use_cache)
+            created.append(self)
+
+        def get_paths(self, **kwargs):
+            return {'paths': []}
+
+    monkeypatch.setattr(cli, 'JalapenoAPI', RecordingAPI)
+    result = CliRunner().invoke(cli.main, args + ['get-paths', '-s', 'a', '-d', 'b'])
+
+    assert result.exit_code == 0
+    assert created[0].use_cache is use_cache
+
+
+@pytest.mark.parametrize('env', [{'JALACTL_LOG_LEVEL': 'debug'}, {'VPP_DEBUG': '1'}])
+def test_cli_debug_logging_is_scoped_to_srctl(monkeypatch, env):
+    import logging
+    from click.testing import CliRunner
+    from srctl import cli
+    monkeypatch.delenv('JALACTL_LOG_LEVEL', raising=False)
+    monkeypatch.delenv('VPP_DEBUG', raising=False)
+    for name, value in env.items():
+        monkeypatch.setenv(name, value)
+    srctl_logger = logging.getLogger('srctl')
+    monkeypatch.setattr(srctl_logger, 'level', srctl_logger.level)
+    created = []
+
+    class RecordingAPI(api.JalapenoAPI):
+        def __init__(self, config, use_cache=True):
+            super().__init__(config, use_cache=use_cache)
+            created.append(self)
+
+        def get_paths(self, **kwargs):
+            return {'paths': []}
+
+    monkeypatch.setattr(cli, 'JalapenoAPI', RecordingAPI)
+    result = CliRunner().invoke(cli.main, ['get-paths', '-s', 'a', '-d', 'b'])
+
+    assert result.exit_code == 0
+    assert srctl_logger.getEffectiveLevel() == logging.DEBUG
+    assert not logging.getLogger('urllib3').isEnabledFor(logging.DEBUG)
+    assert created[0].debug is True
+
+
+def apply_error(client, programmer, request):
+    """Apply a request that must fail validation, checking no API or programmer calls were made"""
+    with pytest.raises(ValueError) as excinfo:
+        client.apply(request)
+    assert client.session.urls == []
+    assert programmer.platforms == []
+    assert programmer.routes == []
+    return str(excinfo.value).splitlines()
+
+
+def test_apply_aggregates_errors_across_vrfs(client, programmer):
+    vrfs = [{'name': 'blue', 'tableId': 100, 'ipv6': {'routes': [route('b', 'fc00::/300')]}},
+            {'name': 'red', 'ipv4': {'routes': [route('c', 'not-a-prefix')]}},
+            {'name': 'green', 'tableId': 200, 'ipv4': {'routes': [route('d', '10.0.3.0/24', metric=['latency'])]}}]
+
+    errors = apply_error(client, programmer, path_request([route('a', '10.0.0.0/33')], vrfs))
+
+    assert errors[0] == 'Invalid PathRequest spec:'
+    assert len(errors) == 5
+    assert errors[1].startswith('  a: Invalid destination prefix')
+    assert errors[2].startswith('  b: Invalid destination prefix')
+    assert errors[3] == '  tableId must be specified for VRF red'
+    assert errors[4] == "  d: Unsupported metric: ['latency']"
+
+
+@pytest.mark.parametrize('platform', ['cisco', ['linux']])
+def test_apply_reports_unsupported_platform_with_route_errors(client, programmer, platform):
+    request = path_request([route('a', '10.0.0.0/24', outbound_interface=None), route('b', 'bad')])
+    request['spec']['platform'] = platform
+
+    errors = apply_error(client, programmer, request)
+
+    assert errors[1:] == [f'  Unsupported platform: {platform}',
+                          "  b: Invalid destination prefix: 'bad' does not appear to be an IPv4 or IPv6 network"]
+
+
+def test_apply_reports_platform_rules(client, programmer):
+    request = path_request([route('a', '10.0.0.0/24', outbound_interface=None)])
+    assert apply_error(client, programmer, request)[1:] == ['  a: outbound_interface is required']
+
+    request['spec']['platform'] = 'VPP'
+    assert apply_error(client, programmer, request)[1:] == ['  a: BSID is required for VPP routes']
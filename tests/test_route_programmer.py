@@ -0,0 +1,294 @@
+import socket
+import threading
+
+import pytest
+
+from srctl import route_programmer
+
+
+class FakeIPRoute:
+    """Records netlink calls and keeps a single route table in memory"""
+    routes = {}
+    calls = []
+    writers = {}
+    lock = threading.Lock()
+
+    def link_lookup(self, ifname):
+        return [7]
+
+    def route(self, command, **kwargs):
+        with self.lock:
+            self.calls.append(command)
+        if command == 'dump':
+            return []
+        if command == 'replace':
+            key = (kwargs['table'] or 254, kwargs['dst'])
+            with self.lock:
+                self.routes[key] = kwargs['encap']['segs'][0]
+                self.writers.setdefault(key, []).append(threading.get_ident())
+        return []
+
+    def close(self):
+        pass
+
+
+class RecordingExecutor:
+    """Runs submitted work inline, recording the work items handed to map()"""
+    tasks = []
+
+    def __init__(self, max_workers, initializer=None):
+        self.initializer = initializer
+
+    def __enter__(self):
+        if self.initializer:
+            self.initializer()
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def map(self, fn, iterable):
+        items = list(iterable)
+        self.tasks.append(items)
+        return [fn(item) for item in items]
+
+
+@pytest.fixture
+def programmer(monkeypatch):
+    FakeIPRoute.routes = {}
+    FakeIPRoute.calls = []
+    FakeIPRoute.writers = {}
+    monkeypatch.setattr(route_programmer, 'IPRoute', FakeIPRoute)
+    monkeypatch.setattr(route_programmer.os, 'geteuid', lambda: 0)
+    return route_programmer.LinuxRouteProgrammer()
+
+
+def duplicate_prefix_routes():
+    routes = [dict(destination_prefix='10.0.0.0/24', srv6_usid=f'fc00:0:{i}::',
+                   outbound_interface='eth0', table_id=100) for i in range(1, 5)]
+    routes += [dict(destination_prefix=f'10.1.{i}.0/24', srv6_usid='fc00:0:9::',
+                    outbound_interface='eth0', table_id=100) for i in range(20)]
+    # Table 0 is the main table, so this is a different prefix key from table 100
+    routes.append(dict(destination_prefix='10.0.0.0/24', srv6_usid='fc00:0:8::',
+                       outbound_interface='eth0', table_id=0))
+    return routes
+
+
+def test_program_routes_groups_duplicate_prefixes_in_spec_order(programmer, monkeypatch):
+    RecordingExecutor.tasks = []
+    monkeypatch.setattr(route_programmer, 'ThreadPoolExecutor', RecordingExecutor)
+
+    results = programmer.program_routes(duplicate_prefix_routes())
+
+    assert all(success for success, _ in results)
+    assert RecordingExecutor.tasks == [[[0, 1, 2, 3]] + [[i] for i in range(4, 25)]]
+    assert FakeIPRoute.routes[(100, '10.0.0.0/24')] == 'fc00:0:4:0:0:0:0:0'
+    assert FakeIPRoute.routes[(254, '10.0.0.0/24')] == 'fc00:0:8:0:0:0:0:0'
+
+
+def test_program_routes_writes_each_prefix_from_one_worker(programmer):
+    results = programmer.program_routes(duplicate_prefix_routes())
+
+    assert all(success for success, _ in results)
+    assert len(FakeIPRoute.writers[(100, '10.0.0.0/24')]) == 4
+    assert len(set(FakeIPRoute.writers[(100, '10.0.0.0/24')])) == 1
+    assert FakeIPRoute.routes[(100, '10.0.0.0/24')] == 'fc00:0:4:0:0:0:0:0'
+
+
+class FakeVppctl:
+    """Stands in for subprocess, answering a piped vppctl batch like VPP's CLI"""
+
+    def __init__(self, failing=(), returncode=0, stop_after=None, stderr=''):
+        self.failing = failing
+        self.returncode = returncode
+        self.stop_after = stop_after
+        self.stderr = stderr
+        self.inputs = []
+
+    def run(self, args, input=None, **kwargs):
+        self.inputs.append(input)
+        output = []
+        for count, command in enumerate(input.splitlines()):
+            if self.stop_after is not None and count >= self.stop_after:
+                break
+            output.append(f"vpp# {command}")
+            if command.startswith('echo '):
+                output.append(command[len('echo '):])
+            elif any(text in command for text in self.failing):
+                output.append("sr policy add: BSID already exists")
+        result = type('CompletedProcess', (), {})()
+        result.returncode = self.returncode
+        result.stdout = '\n'.join(output) + '\n'
+        result.stderr = self.stderr
+        return result
+
+
+def vpp_programmer(monkeypatch, vppctl):
+    programmer = route_programmer.VPPRouteProgrammer.__new__(route_programmer.VPPRouteProgrammer)
+    monkeypatch.setattr(programmer, 'subprocess', vppctl, raising=False)
+    return programmer
+
+
+def vpp_routes(count):
+    return [dict(destination_prefix=f'10.0.{i}.0/24', srv6_usid=f'fc00:0:{i + 1}::', bsid=f'fc00:0:100::{i + 1}')
+            for i in range(count)]
+
+
+def test_vpp_program_routes_reports_bad_usid_per_route(monkeypatch):
+    vppctl = FakeVppctl()
+    routes = vpp_routes(3)
+    routes[1]['srv6_usid'] = 1234
+
+    results = vpp_programmer(monkeypatch, vppctl).program_routes(routes)
+
+    assert [success for success, _ in results] == [True, False, True]
+    assert len(vppctl.inputs) == 1
+    assert '10.0.1.0/24' not in vppctl.inputs[0]
+
+
+def test_vpp_program_routes_reports_failed_command_per_route(monkeypatch):
+    vppctl = FakeVppctl(failing=('bsid fc00:0:100::2 ',))
+
+    results = vpp_programmer(monkeypatch, vppctl).program_routes(vpp_routes(3))
+
+    assert [success for success, _ in results] == [True, False, True]
+    assert 'BSID already exists' in results[1][1]
+
+
+def test_vpp_program_routes_fails_routes_after_vppctl_exits(monkeypatch):
+    # Three commands per route; vppctl dies partway through the second route
+    vppctl = FakeVppctl(returncode=1, stop_after=4, stderr='connection lost')
+
+    results = vpp_programmer(monkeypatch, vppctl).program_routes(vpp_routes(3))
+
+    assert [success for success, _ in results] == [True, False, False]
+    assert 'connection lost' in results[2][1]
+
+
+class FakeSRH(dict):
+    pass
+
+
+class FakeEncap:
+    def __init__(self, segs):
+        self.srh = FakeSRH(mode='encap', segs=segs)
+
+    def get_attr(self, name):
+        return self.srh if name == 'SEG6_IPTUNNEL_SRH' else None
+
+
+class FakeRouteMsg(dict):
+    def __init__(self, dst, dst_len, oif, segs, table=100):
+        family = socket.AF_INET if dst and '.' in dst else socket.AF_INET6
+        super().__init__(family=family, dst_len=dst_len, table=table)
+        self.attrs = {'RTA_DST': dst, 'RTA_OIF': oif, 'RTA_TABLE': table, 'RTA_ENCAP': FakeEncap(segs)}
+
+    def get(self, key, default=None):
+        return self.attrs.get(key, super().get(key, default))
+
+
+class ExistingRouteIPRoute(FakeIPRoute):
+    """Like the kernel, filters a 'dump' by family only and returns every table and prefix"""
+    existing = []
+
+    def route(self, command, **kwargs):
+        if command == 'dump':
+            with self.lock:
+                self.calls.append(command)
+            return [msg for msg in self.existing if msg['family'] == kwargs['family']]
+        return super().route(command, **kwargs)
+
+
+def linux_route(destination_prefix, table_id=100):
+    return {'destination_prefix': destination_prefix, 'srv6_usid': 'fc00:0:1::',
+            'outbound_interface': 'eth0', 'table_id': table_id}
+
+
+@pytest.fixture
+def existing_routes(programmer, monkeypatch):
+    monkeypatch.setattr(route_programmer, 'IPRoute', ExistingRouteIPRoute)
+    programmer.iproute = ExistingRouteIPRoute()
+
+    def install(*routes):
+        monkeypatch.setattr(ExistingRouteIPRoute, 'existing', list(routes))
+    return install
+
+
+@pytest.mark.parametrize('route, existing', [
+    (linux_route('10.0.0.0/25'), FakeRouteMsg('10.0.0.0', 24, 7, ['fc00:0:1::'])),
+    (linux_route('10.0.0.0/16'), FakeRouteMsg('10.0.0.0', 24, 7, ['fc00:0:1::'])),
+    (linux_route('0.0.0.0/0'), FakeRouteMsg('10.0.0.0', 24, 7, ['fc00:0:1::'])),
+    (linux_route('::/0'), FakeRouteMsg('fc00:101::', 64, 7, ['fc00:0:1::'])),
+    (linux_route('10.0.0.0/24', table_id=200), FakeRouteMsg('10.0.0.0', 24, 7, ['fc00:0:1::'])),
+    (linux_route('10.0.0.0/24'), FakeRouteMsg('10.0.0.0', 24, 7, ['fc00:0:2::'])),
+])
+def test_program_routes_replaces_when_only_another_route_matches(existing_routes, programmer, route, existing):
+    existing_routes(existing)
+
+    [(success, message)] = programmer.program_routes([route])
+
+    assert success
+    assert 'already programmed' not in message
+    assert FakeIPRoute.calls == ['dump', 'replace']
+
+
+@pytest.mark.parametrize('route, existing', [
+    (linux_route('10.0.0.0/24'), FakeRouteMsg('10.0.0.0', 24, 7, ['fc00:0:1::'])),
+    (linux_route('::/0'), FakeRouteMsg(None, 0, 7, ['fc00:0:1::'])),
+    (linux_route('10.0.0.0/24', table_id=0), FakeRouteMsg('10.0.0.0', 24, 7, ['fc00:0:1::'], table=254)),
+])
+def test_program_routes_skips_identical_route(existing_routes, programmer, route, existing):
+    existing_routes(existing)
+
+    [(success, message)] = programmer.program_routes([route])
+
+    assert success
+    assert 'already programmed' in message
+    assert FakeIPRoute.calls == ['dump']
+
+
+def test_program_routes_dumps_each_family_once_per_batch(existing_routes, programmer):
+    existing_routes(FakeRouteMsg('10.0.0.0', 24, 7, ['fc00:0:1::']),
+                    FakeRouteMsg('fc00:101::', 64, 7, ['fc00:0:1::']))
+    routes = [linux_route(f'10.0.{i}.0/24') for i in range(8)]
+    routes += [linux_route(f'fc00:{i:x}::/64') for i in range(0x100, 0x108)]
+
+    results = programmer.program_routes(routes)
+
+    assert all(success for success, _ in results)
+    assert FakeIPRoute.calls.count('dump') == 2
+    assert FakeIPRoute.calls.count('replace') == 14
+    assert 'already programmed' in results[0][1]
+    assert 'already programmed' in results[9][1]
+
+
+def test_program_route_outside_a_batch_always_replaces(existing_routes, programmer):
+    existing_routes(FakeRouteMsg('10.0.0.0', 24, 7, ['fc00:0:1::']))
+
+    success, message = programmer.program_route(**linux_route('10.0.0.0/24'))
+
+    assert success
+    assert FakeIPRoute.calls == ['replace']
+
+
+def test_factory_clear_closes_cached_programmers(monkeypatch):
+    closed = []
+
+    class ClosingIPRoute(FakeIPRoute):
+        def close(self):
+            closed.append(self)
+
+    monkeypatch.setattr(route_programmer, 'IPRoute', ClosingIPRoute)
+    monkeypatch.setattr(route_programmer.os, 'geteuid', lambda: 0)
+    monkeypatch.setattr(route_programmer.RouteProgrammerFactory, '_cache', {})
+
+    programmer = route_programmer.RouteProgrammerFactory.get_programmer('Linux')
+    assert route_programmer.RouteProgrammerFactory.get_programmer('linux') is programmer
+
+    route_programmer.RouteProgrammerFactory.clear()
+
+    assert len(closed) == 1
+    assert programmer.iproute is None
+    assert route_programmer.RouteProgrammerFactory.get_programmer('linux') is not programmer
+    programmer.close()
+    assert len(closed) == 1